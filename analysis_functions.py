@@ -3,6 +3,8 @@ Analysis Functions for NSF Grants Explorer
 Contains the visualizations for Streamlit app 
 """
 
+import os
+import numpy as np
 import pandas as pd
 import altair as alt
 from vega_datasets import data as vega_data
@@ -41,14 +43,57 @@ CHART_HEIGHT = 400
 MAP_WIDTH = 600
 MAP_HEIGHT = 400
 
+# Years covered by the dashboard and their first/last day, parsed once
+YEARS = list(range(2020, 2026))
+YEAR_STARTS = pd.to_datetime([f'{year}-01-01' for year in YEARS])
+YEAR_ENDS = pd.to_datetime([f'{year}-12-31' for year in YEARS])
+
 
 # DATA LOADING FUNCTIONS
 
+DATA_CSV = 'nsf_data_clean.csv'
+DATA_PARQUET = 'nsf_data_clean.parquet'
+
+# Columns of the grants data used by the dashboard
+DATA_COLUMNS = [
+    'awd_eff_date', 'awd_exp_date', 'awd_amount', 'dir_abbr',
+    'inst_state_code', 'inst_state_name', 'terminated'
+]
+
+
+def read_grants_csv(path=DATA_CSV):
+    """Read the used columns of the cleaned grants CSV and parse its dates."""
+    df = pd.read_csv(
+        path,
+        usecols=DATA_COLUMNS,
+        dtype={'inst_state_code': 'category', 'inst_state_name': 'category',
+               'dir_abbr': 'category', 'terminated': bool},
+        low_memory=False
+    )
+    # Dates are ISO days; an explicit format keeps pandas on its fast parser
+    df['awd_eff_date'] = pd.to_datetime(df['awd_eff_date'], format='%Y-%m-%d', errors='coerce', cache=True)
+    df['awd_exp_date'] = pd.to_datetime(df['awd_exp_date'], format='%Y-%m-%d', errors='coerce', cache=True)
+    return df
+
+
 def load_data():
-    """Load and preprocess the NSF grants data."""
-    df = pd.read_csv('nsf_data_clean.csv', low_memory=False)
-    df['awd_eff_date'] = pd.to_datetime(df['awd_eff_date'], errors='coerce')
-    df['awd_exp_date'] = pd.to_datetime(df['awd_exp_date'], errors='coerce')
+    """Load and preprocess the NSF grants data.
+
+    Uses the Parquet snapshot written by create_parquet.py (dates already
+    parsed) when it is up to date with the CSV, otherwise parses the CSV.
+    """
+    if os.path.exists(DATA_PARQUET) and os.path.getmtime(DATA_PARQUET) >= os.path.getmtime(DATA_CSV):
+        df = pd.read_parquet(DATA_PARQUET, columns=DATA_COLUMNS)
+    else:
+        df = read_grants_csv()
+
+    # Low-cardinality labels (~60 states, ~15 directorates) as categoricals:
+    # smaller in memory and compared by integer code in the prepare_* filters
+    for col in ['inst_state_code', 'inst_state_name', 'dir_abbr']:
+        df[col] = df[col].astype('category')
+    df['terminated'] = df['terminated'].astype(bool)
+    # Funding is reported in millions; divide once here instead of per group
+    df['awd_amount_m'] = df['awd_amount'] / 1_000_000
     return df
 
 
@@ -146,6 +191,13 @@ STATE_LOOKUP_DATA = [
 
 EAST_COAST_STATES = ['NH', 'MA', 'RI', 'NJ', 'DE', 'DC']
 
+# State lookup with label positions (east coast labels offset into the ocean);
+# built once and only read by the charts
+STATE_LOOKUP_DF = pd.DataFrame(STATE_LOOKUP_DATA)
+_is_east_coast = STATE_LOOKUP_DF['state'].isin(EAST_COAST_STATES)
+STATE_LOOKUP_DF['label_longitude'] = np.where(_is_east_coast, STATE_LOOKUP_DF['longitude'] + 2, STATE_LOOKUP_DF['longitude'])
+STATE_LOOKUP_DF['label_latitude'] = np.where(_is_east_coast, STATE_LOOKUP_DF['latitude'] - 1, STATE_LOOKUP_DF['latitude'])
+
 directorate_colors = {
     'MPS': '#1f77b4',
     'CSE': '#E69F00',
@@ -158,47 +210,147 @@ directorate_colors = {
     'O/D': '#999999',
 }
 
+# Directorates compared in the termination impact chart
+MAIN_DIRECTORATES = ['MPS', 'CSE', 'ENG', 'GEO', 'EDU', 'BIO', 'TIP', 'SBE']
+
 DIR_DOMAIN = ['MPS','CSE','ENG','GEO','EDU','BIO','SBE', 'TIP','O/D']
 DIR_RANGE  = [directorate_colors[k] for k in DIR_DOMAIN]
 DIR_SCALE  = alt.Scale(domain=DIR_DOMAIN, range=DIR_RANGE)
 
+# Political scatter: party colours and the point tooltip, shared by every year
+PARTY_SCALE = alt.Scale(domain=["Democrat", "Republican"], range=["#2166ac", "#b2182b"])
+POLITICAL_TOOLTIP = [
+    alt.Tooltip("State:N", title="State"),
+    alt.Tooltip("active_grants:Q", title="Active Grants", format=","),
+    alt.Tooltip("total_funding_millions:Q", title="Total Funding ($M)", format=",.1f"),
+    alt.Tooltip("terminated_grants:Q", title="Terminated Grants"),
+    alt.Tooltip("termination_pct:Q", title="Termination %", format=".2f"),
+]
+
 
 # Q1: Grants Distribution by State
 
-def prepare_grants_by_state_data(df):
+def _active_years(df, first_year=YEARS[0], last_year=YEARS[-1]):
+    """Expand grants into one entry per year they are active in [first_year, last_year].
+
+    A grant is active in a year if it starts on or before Dec 31 and expires on
+    or after Jan 1 of that year. Grants with missing dates are never active; a
+    grant expiring before it starts still counts in a year both dates fall in.
+
+    Returns:
+        Tuple (rows, years) of arrays: the positional row of each grant in df,
+        repeated once per active year, and the matching year.
+    """
+    eff_year = df['awd_eff_date'].dt.year.clip(lower=first_year)
+    exp_year = df['awd_exp_date'].dt.year.clip(upper=last_year)
+    counts = (exp_year - eff_year + 1).fillna(0).clip(lower=0).astype(int).to_numpy()
+
+    rows = np.repeat(np.arange(len(df)), counts)
+    # Position of each entry within its grant's run of years: 0, 1, 2, ...
+    offsets = np.arange(len(rows)) - np.repeat(np.cumsum(counts) - counts, counts)
+    years = eff_year.fillna(first_year).astype(int).to_numpy()[rows] + offsets
+    return rows, years
+
+
+def _active_counts(eff_dates, exp_dates):
+    """Count grants active in each of YEARS by binary search on the sorted dates.
+
+    A grant is active in a year if it starts on or before Dec 31 and expires on
+    or after Jan 1 of that year. Grants with missing dates are never active; a
+    grant expiring before it starts still counts in a year both dates fall in.
+
+    Returns:
+        Array with the number of active grants for each year in YEARS
+    """
+    # Grants whose expiry year is before their start year are active in no
+    # year. Dropping them keeps the subtraction below exact: every remaining
+    # grant that expired before a year began had also started by its end
+    valid = eff_dates.notna() & exp_dates.notna() & (eff_dates.dt.year <= exp_dates.dt.year)
+    eff = np.sort(eff_dates[valid].to_numpy(dtype='datetime64[ns]'))
+    exp = np.sort(exp_dates[valid].to_numpy(dtype='datetime64[ns]'))
+
+    # Started by the year end, minus those already expired before it began
+    return (np.searchsorted(eff, YEAR_ENDS.to_numpy(), side='right')
+            - np.searchsorted(exp, YEAR_STARTS.to_numpy(), side='left'))
+
+
+def count_terminated(df):
+    """Count terminated grants per state and per directorate.
+
+    The app computes this once and passes it to the prepare_* functions,
+    which otherwise count on their own.
+
+    Returns:
+        Dict with 'by_state' and 'by_directorate' Series of counts
+    """
+    terminated = df['terminated']
+    return {
+        'by_state': terminated.groupby(df['inst_state_code'], observed=True).sum(),
+        'by_directorate': terminated.groupby(df['dir_abbr'], observed=True).sum(),
+    }
+
+
+def prepare_grants_by_state_data(df, terminated_counts=None):
     """Prepare grants by state data for choropleth map."""
-    results = []
-    for state in df['inst_state_code'].unique():
-        state_df = df[df['inst_state_code'] == state]
-        state_name = state_df['inst_state_name'].iloc[0] if len(state_df) > 0 else state
-        
-        for year in range(2020, 2026):
-            year_start = pd.Timestamp(f'{year}-01-01')
-            year_end = pd.Timestamp(f'{year}-12-31')
-            active_mask = (
-                (state_df['awd_eff_date'] <= year_end) & 
-                (state_df['awd_exp_date'] >= year_start)
-            )
-            num_active = active_mask.sum()
-            terminated_count = state_df['terminated'].sum() if year == 2025 else 0
-            terminated_pct = (terminated_count / num_active * 100) if num_active > 0 else 0
-            
-            results.append({
-                'state': state,
-                'state_name': state_name,
-                'year': year,
-                'num_grants': num_active,
-                'terminated_grants': terminated_count,
-                'terminated_pct': round(terminated_pct, 2)
-            })
-    
-    grants_df = pd.DataFrame(results)
-    grants_df['id'] = grants_df['state'].map(STATE_FIPS)
-    grants_df = grants_df.dropna(subset=['id'])
-    grants_df['id'] = grants_df['id'].astype(int)
+    if terminated_counts is None:
+        terminated_counts = count_terminated(df)
+
+    # States in order of first appearance, named after their first grant
+    first_rows = df.dropna(subset=['inst_state_code']).drop_duplicates('inst_state_code')
+    first_rows = first_rows[first_rows['inst_state_code'].isin(STATE_FIPS.keys())]
+    state_names = first_rows.set_index('inst_state_code')['inst_state_name']
+
+    # Active grants per (state, year), with zeros for years without grants
+    rows, active_years = _active_years(df)
+    active = pd.DataFrame({
+        'state': df['inst_state_code'].to_numpy()[rows],
+        'year': active_years,
+    })
+    grid = pd.MultiIndex.from_product([state_names.index, YEARS], names=['state', 'year'])
+    num_active = active.groupby(['state', 'year']).size().reindex(grid, fill_value=0)
+
+    grants_df = grid.to_frame(index=False)
+    grants_df.insert(1, 'state_name', grants_df['state'].map(state_names))
+    grants_df['num_grants'] = num_active.to_numpy()
+
+    # Terminations only apply to the current year
+    terminated_by_state = terminated_counts['by_state']
+    grants_df['terminated_grants'] = np.where(
+        grants_df['year'] == 2025, grants_df['state'].map(terminated_by_state), 0
+    )
+    num_grants = grants_df['num_grants'].to_numpy()
+    terminated_pct = np.divide(
+        grants_df['terminated_grants'].to_numpy() * 100, num_grants,
+        out=np.zeros(len(grants_df)), where=num_grants > 0
+    )
+    grants_df['terminated_pct'] = terminated_pct.round(2)
+
+    grants_df['id'] = grants_df['state'].map(STATE_FIPS).astype(int)
     return grants_df
 
 
+# Map layers that do not depend on the selected year, built once
+US_STATES = alt.topo_feature(vega_data.us_10m.url, 'states')
+
+# Leader lines for east coast states
+MAP_LEADER_LINES = alt.Chart(STATE_LOOKUP_DF[STATE_LOOKUP_DF['state'].isin(EAST_COAST_STATES)]).mark_rule(
+    strokeWidth=1, color='gray', opacity=0.6, strokeDash=[3, 3]
+).encode(
+    longitude='longitude:Q', latitude='latitude:Q',
+    longitude2='label_longitude:Q', latitude2='label_latitude:Q'
+).project(type='albersUsa')
+
+# State labels
+MAP_STATE_LABELS = alt.Chart(STATE_LOOKUP_DF).mark_text(
+    fontSize=9, fontWeight='bold', color='black', opacity=0.7
+).encode(
+    longitude='label_longitude:Q', latitude='label_latitude:Q', text='state:N'
+).project(type='albersUsa')
+
+# Puerto Rico position, drawn as a circle outside the albersUsa states
+PR_LOOKUP = STATE_LOOKUP_DF[STATE_LOOKUP_DF['state'] == 'PR'].reset_index(drop=True)
+
+
 def create_choropleth_map(year_data, selected_year, min_grants, max_grants, state_selection):
     """Create choropleth map of US states showing grant distribution.
     
@@ -212,19 +364,8 @@ def create_choropleth_map(year_data, selected_year, min_grants, max_grants, stat
     Returns:
         Altair chart object (layered map with labels)
     """
-    us_states = alt.topo_feature(vega_data.us_10m.url, 'states')
-    
-    # Prepare state lookup with label positions
-    state_lookup = pd.DataFrame(STATE_LOOKUP_DATA)
-    state_lookup['label_longitude'] = state_lookup.apply(
-        lambda row: row['longitude'] + 2 if row['state'] in EAST_COAST_STATES else row['longitude'], axis=1
-    )
-    state_lookup['label_latitude'] = state_lookup.apply(
-        lambda row: row['latitude'] - 1 if row['state'] in EAST_COAST_STATES else row['latitude'], axis=1
-    )
-
     # Choropleth base map
-    choropleth = alt.Chart(us_states).mark_geoshape(
+    choropleth = alt.Chart(US_STATES).mark_geoshape(
         stroke='darkgray',
         strokeWidth=0.5
     ).encode(
@@ -250,24 +391,12 @@ def create_choropleth_map(year_data, selected_year, min_grants, max_grants, stat
         state_selection
     )
 
-    # Leader lines for east coast states
-    leader_lines = alt.Chart(state_lookup[state_lookup['state'].isin(EAST_COAST_STATES)]).mark_rule(
-        strokeWidth=1, color='gray', opacity=0.6, strokeDash=[3, 3]
-    ).encode(
-        longitude='longitude:Q', latitude='latitude:Q',
-        longitude2='label_longitude:Q', latitude2='label_latitude:Q'
-    ).project(type='albersUsa')
-
-    # State labels
-    state_labels = alt.Chart(state_lookup).mark_text(
-        fontSize=9, fontWeight='bold', color='black', opacity=0.7
-    ).encode(
-        longitude='label_longitude:Q', latitude='label_latitude:Q', text='state:N'
-    ).project(type='albersUsa')
-
     # Puerto Rico circle (since it's not in the continental US projection)
-    pr_data = state_lookup[state_lookup['state'] == 'PR'].copy()
-    pr_data = pr_data.merge(year_data[['id', 'num_grants', 'terminated_grants', 'terminated_pct']], on='id', how='left')
+    # Its figures are the single PR row of year_data, placed beside its position
+    pr_stats = year_data.loc[
+        year_data['id'] == STATE_FIPS['PR'], ['num_grants', 'terminated_grants', 'terminated_pct']
+    ]
+    pr_data = pd.concat([PR_LOOKUP, pr_stats.reset_index(drop=True)], axis=1)
     
     pr_circle = alt.Chart(pr_data).mark_circle(size=400, stroke='white', strokeWidth=2).encode(
         longitude='longitude:Q', latitude='latitude:Q',
@@ -278,7 +407,7 @@ def create_choropleth_map(year_data, selected_year, min_grants, max_grants, stat
     ).project(type='albersUsa')
 
     # Combine all layers
-    map_chart = (choropleth + leader_lines + state_labels + pr_circle).properties(
+    map_chart = (choropleth + MAP_LEADER_LINES + MAP_STATE_LABELS + pr_circle).properties(
         width=MAP_WIDTH,
         height=MAP_HEIGHT,
         title=alt.TitleParams(
@@ -295,39 +424,34 @@ def create_choropleth_map(year_data, selected_year, min_grants, max_grants, stat
 
 # Q2: Grants Distribution by Directorate
 
-def prepare_directorate_data(df):
+def prepare_directorate_data(df, terminated_counts=None):
     """Prepare data for directorate visualization."""
+    if terminated_counts is None:
+        terminated_counts = count_terminated(df)
+    terminated_by_directorate = terminated_counts['by_directorate']
+
     directorate_results = []
-    for directorate in df['dir_abbr'].unique():
-        dir_df = df[df['dir_abbr'] == directorate]
-        for year in range(2020, 2026):
-            year_start = pd.Timestamp(f'{year}-01-01')
-            year_end = pd.Timestamp(f'{year}-12-31')
-            active_mask = (
-                (dir_df['awd_eff_date'] <= year_end) & 
-                (dir_df['awd_exp_date'] >= year_start)
-            )
-            num_active = active_mask.sum()
-            terminated_count = dir_df['terminated'].sum() if year == 2025 else 0
-            
+    all_years_results = []
+    for directorate, dir_df in df.groupby('dir_abbr', observed=True, sort=False):
+        num_active = _active_counts(dir_df['awd_eff_date'], dir_df['awd_exp_date'])
+        num_terminated = terminated_by_directorate[directorate]
+        for year, count in zip(YEARS, num_active):
             directorate_results.append({
                 'directorate': directorate,
                 'year': str(year),
-                'num_grants': num_active,
-                'terminated_grants': terminated_count
+                'num_grants': count,
+                'terminated_grants': num_terminated if year == 2025 else 0
             })
-    
-    # "All years" aggregation
-    for directorate in df['dir_abbr'].unique():
-        dir_df = df[df['dir_abbr'] == directorate]
-        directorate_results.append({
+
+        # "All years" aggregation, listed after every per-year row
+        all_years_results.append({
             'directorate': directorate,
             'year': 'All years',
             'num_grants': len(dir_df),
-            'terminated_grants': dir_df['terminated'].sum()
+            'terminated_grants': num_terminated
         })
     
-    return pd.DataFrame(directorate_results)
+    return pd.DataFrame(directorate_results + all_years_results)
 
 
 def create_directorate_evolution_chart(directorate_data):
@@ -397,34 +521,33 @@ def create_directorate_evolution_chart(directorate_data):
 
 # Q3: Termination Impact Analysis
 
-def prepare_termination_impact_data(df):
+def prepare_termination_impact_data(df, terminated_counts=None):
     """Prepare data for termination impact analysis."""
-    termination_impact = []
-    main_directorates = ['MPS', 'CSE', 'ENG', 'GEO', 'EDU', 'BIO', 'TIP', 'SBE']
-    
-    for directorate in df['dir_abbr'].unique():
-        if directorate not in main_directorates:
-            continue
-        dir_df = df[df['dir_abbr'] == directorate]
-        
-        year_start = pd.Timestamp('2025-01-01')
-        year_end = pd.Timestamp('2025-12-31')
-        active_mask = (
-            (dir_df['awd_eff_date'] <= year_end) & 
-            (dir_df['awd_exp_date'] >= year_start)
-        )
-        num_active_2025 = active_mask.sum()
-        num_terminated = dir_df['terminated'].sum()
-        termination_pct = (num_terminated / num_active_2025 * 100) if num_active_2025 > 0 else 0
-        
-        termination_impact.append({
-            'directorate': directorate,
-            'active_grants_2025': num_active_2025,
-            'terminated_grants': num_terminated,
-            'termination_pct': round(termination_pct, 2)
-        })
-    
-    return pd.DataFrame(termination_impact).sort_values('terminated_grants', ascending=False)
+    if terminated_counts is None:
+        terminated_counts = count_terminated(df)
+    terminated_by_directorate = terminated_counts['by_directorate']
+
+    # dir_abbr is categorical, so isin compares category codes
+    main_df = df[df['dir_abbr'].isin(MAIN_DIRECTORATES)]
+    active_2025 = (
+        (main_df['awd_eff_date'] <= YEAR_ENDS[-1]) &
+        (main_df['awd_exp_date'] >= YEAR_STARTS[-1])
+    )
+    num_active_2025 = active_2025.groupby(main_df['dir_abbr'], observed=True, sort=False).sum()
+
+    termination_impact = pd.DataFrame({
+        'directorate': num_active_2025.index.astype(object),
+        'active_grants_2025': num_active_2025.to_numpy(),
+        'terminated_grants': terminated_by_directorate.reindex(num_active_2025.index).to_numpy(),
+    })
+    termination_pct = (
+        termination_impact['terminated_grants']
+        / termination_impact['active_grants_2025'].where(termination_impact['active_grants_2025'] > 0)
+        * 100
+    )
+    termination_impact['termination_pct'] = termination_pct.round(2).fillna(0)
+
+    return termination_impact.sort_values('terminated_grants', ascending=False)
 
 
 def create_termination_impact_chart(termination_impact_df):
@@ -462,39 +585,34 @@ def create_termination_impact_chart(termination_impact_df):
 
 def prepare_lifecycle_data_with_statecode(df):
     """Prepare daily lifecycle data using vectorized operations."""
-    # Ensure datetime format
-    df = df.copy()
-    # Note: dates are already converted in load_data, but ensuring consistency
-    
-    clean_df = df.dropna(subset=['awd_eff_date', 'awd_exp_date', 'inst_state_name', 'inst_state_code']).copy()
+    # Dates are already converted in load_data; df is only read here
+    clean_df = df[['awd_eff_date', 'awd_exp_date', 'inst_state_name', 'inst_state_code']].dropna()
     clean_df = clean_df[clean_df['awd_eff_date'] <= clean_df['awd_exp_date']]
 
-    # Create events DataFrame
-    starts = clean_df[['awd_eff_date', 'inst_state_name']].rename(columns={'awd_eff_date': 'date'})
-    starts['change'] = 1
-
-    ends = clean_df[['awd_exp_date', 'inst_state_name']].copy()
-    ends['date'] = ends['awd_exp_date'] + pd.Timedelta(days=1)
-    ends = ends.drop(columns=['awd_exp_date'])
-    ends['change'] = -1
-
-    # Combine and reshape
-    all_events = pd.concat([starts, ends], ignore_index=True)
-    daily_changes = all_events.groupby(['date', 'inst_state_name'])['change'].sum().unstack(fill_value=0)
+    # Daily window shown in the chart: 2020-01-01 to 2026-01-01
+    days = pd.date_range('2020-01-01', '2026-01-01', freq='D', name='date')
+    n_days = len(days)
+    state_idx, state_names = pd.factorize(clean_df['inst_state_name'], sort=True)
+
+    # Scatter +1 on the effective day and -1 the day after expiry into a
+    # (day, state) grid; the running sum down the days is the active count.
+    # Grants that started before the window count from its first day, and
+    # changes after its last day land in an extra row that is dropped
+    one_day = np.timedelta64(1, 'D')
+    day0 = days[0].to_datetime64()
+    start_idx = ((clean_df['awd_eff_date'].to_numpy() - day0) // one_day).clip(0, n_days)
+    end_idx = ((clean_df['awd_exp_date'].to_numpy() - day0) // one_day + 1).clip(0, n_days)
+
+    daily_changes = np.zeros((n_days + 1, len(state_names)), dtype=np.int32)
+    np.add.at(daily_changes, (start_idx, state_idx), 1)
+    np.add.at(daily_changes, (end_idx, state_idx), -1)
+    active_counts_by_state = pd.DataFrame(
+        np.cumsum(daily_changes[:-1], axis=0), index=days, columns=np.asarray(state_names, dtype=object)
+    )
 
-    # Resample and Calculate
-    # Use daily resolution 
-    daily_changes = daily_changes.resample('D').sum().fillna(0)
-    active_counts_by_state = daily_changes.cumsum()
-    
     # Add Allstates column
     active_counts_by_state['Allstates'] = active_counts_by_state.sum(axis=1)
 
-    # Filter for required date range: 2020-01-01 to 2026 
-    start_date = pd.Timestamp('2020-01-01')
-    end_date = pd.Timestamp('2026-01-01') 
-    active_counts_by_state = active_counts_by_state.loc[start_date:end_date]
-
     # Melt to Long Format
     active_counts_long = active_counts_by_state.reset_index().melt(
         id_vars=['date'],
@@ -504,11 +622,17 @@ def prepare_lifecycle_data_with_statecode(df):
 
     # Get state codes for the chart selection
     # We need to preserve inst_state_code for the 'state' column used in selection
-    id_map = clean_df[['inst_state_name', 'inst_state_code']].drop_duplicates()
-    
-    # Merge to get the codes
-    active_counts_long = active_counts_long.merge(id_map, on='inst_state_name', how='left')
-    
+    # (as plain strings, so the Allstates code below can be assigned). A name
+    # maps to its first code: the 'RI REQUIRED' placeholder is shared by
+    # several foreign codes that cannot be selected on the map anyway
+    id_map = (
+        clean_df[['inst_state_name', 'inst_state_code']]
+        .drop_duplicates('inst_state_name')
+        .set_index('inst_state_name')['inst_state_code']
+        .astype(object)
+    )
+    active_counts_long['inst_state_code'] = active_counts_long['inst_state_name'].map(id_map)
+
     # Handle Allstates code
     active_counts_long.loc[active_counts_long['inst_state_name'] == 'Allstates', 'inst_state_code'] = 'Allstates'
 
@@ -534,9 +658,31 @@ def create_lifecycle_line_chart(lifecycle_df, state_selection):
         Altair chart object
     """
     # Rename state_code to state for selection matching
-    lifecycle_df_renamed = lifecycle_df.copy()
-    lifecycle_df_renamed['state'] = lifecycle_df_renamed['state_code']
-    
+    lifecycle_df_renamed = lifecycle_df[['Date', 'State', 'state_code', 'Active Grants']].rename(
+        columns={'state_code': 'state'}
+    )
+
+    # Split the all-states total from the per-state series and take each line's
+    # last point here, instead of filtering and ranking every row in the browser
+    is_all = lifecycle_df_renamed['State'] == 'Allstates'
+    last_points = lifecycle_df_renamed.loc[lifecycle_df_renamed.groupby('State')['Date'].idxmax()]
+    all_last = last_points[last_points['State'] == 'Allstates']
+    states_last = last_points[last_points['State'] != 'Allstates']
+
+    # Daily series is the largest dataset in the dashboard: ship it as CSV text
+    # instead of row-wise JSON records so field names are not repeated per row
+    def to_csv_data(frame):
+        # Format each distinct day once: per-row strftime dominated to_csv
+        day_codes, days = pd.factorize(frame['Date'])
+        frame = frame.assign(Date=days.strftime('%Y-%m-%dT%H:%M:%S')[day_codes])
+        return alt.InlineData(
+            values=frame.to_csv(index=False),
+            format=alt.DataFormat(type='csv', parse={'Date': 'date', 'Active Grants': 'number'})
+        )
+
+    all_data = to_csv_data(lifecycle_df_renamed[is_all])
+    states_data = to_csv_data(lifecycle_df_renamed[~is_all])
+
     # Dynamic Y scale based on selection status
     y_scale = alt.Scale(
         domainRaw=alt.expr("length(data('state_select_store')) > 0 ? [0, 6000] : [0, 60000]"),
@@ -560,7 +706,7 @@ def create_lifecycle_line_chart(lifecycle_df, state_selection):
     
     # All-states line (only when nothing selected)
     all_layer = (
-        alt.Chart(lifecycle_df_renamed)
+        alt.Chart(all_data)
         .mark_line(color="#1f77b4")
         .encode(
             x=x_axis,
@@ -572,18 +718,11 @@ def create_lifecycle_line_chart(lifecycle_df, state_selection):
             ],
         )
         .transform_filter("length(data('state_select_store')) == 0")
-        .transform_filter(alt.datum.State == 'Allstates')
     )
 
     all_label = (
-        alt.Chart(lifecycle_df_renamed)
+        alt.Chart(all_last)
         .transform_filter("length(data('state_select_store')) == 0")
-        .transform_filter(alt.datum.State == 'Allstates')
-        .transform_window(
-            sort=[alt.SortField("Date", order="descending")],
-            rank="rank()",
-        )
-        .transform_filter(alt.datum.rank == 1)
         .mark_text(align="left", dx=6, fontSize=11, color="#1f77b4")
         .encode(
             x=alt.X("Date:T", axis=alt.Axis(title="Date", format="%b %Y", values=tick_values, labelAngle=-45)),
@@ -601,17 +740,11 @@ def create_lifecycle_line_chart(lifecycle_df, state_selection):
         empty="none",
     )
 
-    # Base chart for selected states only
-    selected_base = (
-        alt.Chart(lifecycle_df_renamed)
-        .transform_filter("length(data('state_select_store')) > 0")
-        .transform_filter(state_selection)
-        .transform_filter(alt.datum.State != 'Allstates')
-    )
-
     # Selected lines: dim all, highlight hovered
     selected_lines = (
-        selected_base
+        alt.Chart(states_data)
+        .transform_filter("length(data('state_select_store')) > 0")
+        .transform_filter(state_selection)
         .mark_line()
         .encode(
             x=x_axis,
@@ -631,13 +764,9 @@ def create_lifecycle_line_chart(lifecycle_df, state_selection):
 
     # End-of-line labels
     end_labels = (
-        selected_base
-        .transform_window(
-            sort=[alt.SortField("Date", order="descending")],
-            rank="rank()",
-            groupby=["State"],
-        )
-        .transform_filter(alt.datum.rank == 1)
+        alt.Chart(states_last)
+        .transform_filter("length(data('state_select_store')) > 0")
+        .transform_filter(state_selection)
         .mark_text(align="left", dx=6, fontSize=11)
         .encode(
             x="Date:T",
@@ -748,86 +877,109 @@ def create_terminated_bar_chart(terminated_data, state_selection):
 
 # Q6: Political Alignment Analysis
 
-def get_political_alignment(row):
-    if row['year'] < 2024:
-        return row['2020_Election_Winner']
-    else:
-        return row['2024_Election_Winner']
-    
-
-def prepare_political_data(df, political_df):
+def prepare_political_data(df, political_df, terminated_counts=None):
     """Prepare data for political alignment visualization."""
-    state_year_stats = []
-    for state_abbr in df['inst_state_code'].unique():
-        state_df = df[df['inst_state_code'] == state_abbr]
-        
-        for year in range(2020, 2026):
-            year_start = pd.Timestamp(f'{year}-01-01')
-            year_end = pd.Timestamp(f'{year}-12-31')
-            
-            active_mask = (
-                (state_df['awd_eff_date'] <= year_end) & 
-                (state_df['awd_exp_date'] >= year_start)
-            )
-            active_grants = state_df[active_mask]
-            num_active = len(active_grants)
-            total_funding = active_grants['awd_amount'].sum() / 1000000
-            
-            if year == 2025:
-                num_terminated = state_df['terminated'].sum()
-                terminated_funding = state_df[state_df['terminated'] == True]['awd_amount'].sum() / 1000000
-            else:
-                num_terminated = 0
-                terminated_funding = 0
-            
-            termination_pct = (num_terminated / num_active * 100) if num_active > 0 else 0
-            
-            state_year_stats.append({
-                'Abbreviation': state_abbr,
-                'year': year,
-                'active_grants': num_active,
-                'total_funding_millions': round(total_funding, 2),
-                'terminated_grants': int(num_terminated),
-                'terminated_funding_millions': round(terminated_funding, 2),
-                'termination_pct': round(termination_pct, 2)
-            })
-    
-    state_year_df = pd.DataFrame(state_year_stats)
-    source_df = state_year_df.merge(political_df, on='Abbreviation', how='left')
+    if terminated_counts is None:
+        terminated_counts = count_terminated(df)
+    terminated_by_state = terminated_counts['by_state']
+
+    # States in order of first appearance
+    state_codes = df['inst_state_code'].dropna().drop_duplicates().to_numpy()
+
+    # Active grants and their funding per (state, year), zero where none
+    rows, active_years = _active_years(df)
+    active = pd.DataFrame({
+        'Abbreviation': df['inst_state_code'].to_numpy()[rows],
+        'year': active_years,
+        'awd_amount_m': df['awd_amount_m'].to_numpy()[rows],
+    })
+    grid = pd.MultiIndex.from_product([state_codes, YEARS], names=['Abbreviation', 'year'])
+    totals = active.groupby(['Abbreviation', 'year'])['awd_amount_m'].agg(['size', 'sum']).reindex(grid, fill_value=0)
+
+    state_year_df = grid.to_frame(index=False)
+    state_year_df['active_grants'] = totals['size'].to_numpy()
+    state_year_df['total_funding_millions'] = totals['sum'].to_numpy()
+
+    # Terminations only apply to the current year
+    is_current = (state_year_df['year'] == 2025).to_numpy()
+    terminated = df[df['terminated']]
+    terminated_funding = terminated.groupby('inst_state_code', observed=True)['awd_amount_m'].sum()
+    state_abbr = state_year_df['Abbreviation']
+    state_year_df['terminated_grants'] = np.where(is_current, state_abbr.map(terminated_by_state), 0)
+    state_year_df['terminated_funding_millions'] = np.where(
+        is_current, state_abbr.map(terminated_funding).fillna(0), 0
+    )
+    num_active = state_year_df['active_grants'].to_numpy()
+    state_year_df['termination_pct'] = np.divide(
+        state_year_df['terminated_grants'].to_numpy() * 100, num_active,
+        out=np.zeros(len(state_year_df)), where=num_active > 0
+    )
+    rounded = ['total_funding_millions', 'terminated_funding_millions', 'termination_pct']
+    state_year_df[rounded] = state_year_df[rounded].round(2)
+    # Counts and years fit in small ints; floats stay float64, since float32
+    # values serialize to JSON with spurious extra digits
+    counts = ['year', 'active_grants', 'terminated_grants']
+    state_year_df[counts] = state_year_df[counts].apply(pd.to_numeric, downcast='integer')
+    # One political row per state; validate catches a duplicated state in the CSV
+    source_df = state_year_df.merge(political_df, on='Abbreviation', how='left', validate='many_to_one')
     source_df = source_df.dropna(subset=['2020_Election_Winner'])
-    source_df['political_alignment'] = source_df.apply(get_political_alignment, axis=1)
-    source_df = source_df.drop(columns=['2020_Election_Winner', '2024_Election_Winner', 'Current_Gov_Party'], errors='ignore')
+    # Grants before 2024 follow the 2020 election result, later ones the 2024 result
+    source_df['political_alignment'] = pd.Categorical(np.where(
+        source_df['year'] < 2024, source_df['2020_Election_Winner'], source_df['2024_Election_Winner']
+    ))
     
-    # Add State column for chart compatibility
+    # Add State column for chart compatibility (replacing the full state name
+    # from political_df)
     source_df['State'] = source_df['Abbreviation']
     
-    return source_df
+    return source_df[[
+        'Abbreviation', 'year', 'active_grants', 'total_funding_millions', 'terminated_grants',
+        'terminated_funding_millions', 'termination_pct', 'State', 'political_alignment'
+    ]]
+
 
+def create_political_scatter(source_df, selected_year, year_data=None):
+    """Create Gapminder-style scatter plot for political analysis with hover trail.
 
-def create_political_scatter(source_df, selected_year):
-    """Create Gapminder-style scatter plot for political analysis with hover trail."""
+    Args:
+        source_df: Political data for all years (drawn as hover trails)
+        selected_year: Year whose points are shown
+        year_data: Rows of source_df for selected_year, sliced here if not given
+    """
+    if year_data is None:
+        year_data = source_df[source_df['year'] == selected_year]
     
     # Controls
     hover = alt.selection_point(on="mouseover", fields=["State"], empty=False)
     hover_point_opacity = alt.selection_point(on="mouseover", fields=["State"])
-
-    party_colors = alt.Scale(domain=["Democrat", "Republican"], range=["#2166ac", "#b2182b"])
-
-    # Base chart (uses all years data for trails)
+    zoom = alt.selection_interval(bind="scales")
+
+    # Base chart (uses all years data for trails). The trail layers only read
+    # these columns; the tooltip fields come from year_data
+    trail_df = source_df[['State', 'year', 'active_grants', 'total_funding_millions', 'political_alignment']]
+    # Axis domains span every year, so they stay put while the hover layers
+    # below draw only the hovered state's rows (nice=True rounds them as Vega
+    # does for data-derived domains)
+    x_domain = [int(source_df['active_grants'].min()), int(source_df['active_grants'].max())]
+    y_domain = [float(source_df['total_funding_millions'].min()), float(source_df['total_funding_millions'].max())]
     base = (
-        alt.Chart(source_df)
+        alt.Chart(trail_df)
         .encode(
-            x=alt.X("active_grants:Q", scale=alt.Scale(zero=False), title="Number of Active Grants"),
-            y=alt.Y("total_funding_millions:Q", scale=alt.Scale(zero=False), title="Total Funding (Millions $)"),
+            x=alt.X(
+                "active_grants:Q", scale=alt.Scale(zero=False, nice=True, domain=x_domain),
+                title="Number of Active Grants"
+            ),
+            y=alt.Y(
+                "total_funding_millions:Q", scale=alt.Scale(zero=False, nice=True, domain=y_domain),
+                title="Total Funding (Millions $)"
+            ),
             color=alt.Color(
                 "political_alignment:N",
-                scale=party_colors,
+                scale=PARTY_SCALE,
                 title="Political Alignment",
                 legend=alt.Legend(orient="bottom", titleFontSize=12, labelFontSize=10, symbolStrokeWidth=6),
             ),
-            detail="State:N",
         )
-        .interactive()
     )
 
     # Opacity logic (dim valid points if not hovered)
@@ -837,61 +989,54 @@ def create_political_scatter(source_df, selected_year):
         .otherwise(alt.value(0.25))
     )
 
-    # Points filtered by selected_year
+    # Points for selected_year only
     visible_points = (
         base.mark_circle(size=200)
+        .properties(data=year_data)
         .encode(
             opacity=opacity,
-            tooltip=[
-                alt.Tooltip("State:N", title="State"),
-                alt.Tooltip("active_grants:Q", title="Active Grants", format=","),
-                alt.Tooltip("total_funding_millions:Q", title="Total Funding ($M)", format=",.1f"),
-                alt.Tooltip("terminated_grants:Q", title="Terminated Grants"),
-                alt.Tooltip("termination_pct:Q", title="Termination %", format=".2f"),
-            ],
+            tooltip=POLITICAL_TOOLTIP,
         )
-        .transform_filter(alt.datum.year == selected_year)
-        .add_params(hover, hover_point_opacity)
+        .add_params(hover, hover_point_opacity, zoom)
     )
 
-    # Hover trail effect
-    when_hover = alt.when(hover)
+    # Hover trail effect: the hover layers share one filter, so they only
+    # draw the hovered state's rows instead of every row at zero opacity
+    hovered = base.transform_filter(hover)
 
     hover_line = alt.layer(
-        base.mark_trail().encode(
+        hovered.mark_trail().encode(
+            detail="State:N",
             order=alt.Order("year:Q", sort="ascending"),
             size=alt.Size("year:Q", scale=alt.Scale(domain=[2020, 2025], range=[2, 20]), legend=None),
-            opacity=when_hover.then(alt.value(0.5)).otherwise(alt.value(0)),
+            opacity=alt.value(0.5),
             color=alt.value("#444444"),
         ),
-        base.mark_point(size=120).encode(
-            opacity=when_hover.then(alt.value(0.9)).otherwise(alt.value(0)),
+        hovered.mark_point(size=120).encode(
+            opacity=alt.value(0.9),
         ),
     )
 
     # Year labels on hover trail
     year_labels = (
-        base.mark_text(align="left", dx=12, dy=-12, fontSize=12, fontWeight="bold")
+        hovered.mark_text(align="left", dx=12, dy=-12, fontSize=12, fontWeight="bold")
         .encode(
             text="year:O",
             color=alt.value("#333333"),
-            opacity=when_hover.then(alt.value(1)).otherwise(alt.value(0)),
         )
-        .transform_filter(hover)
     )
 
-    # State labels at current year (filtered)
+    # State labels at current year (same dataset as visible_points)
     state_labels = (
-        alt.Chart(source_df)
+        alt.Chart(year_data)
         .mark_text(align="left", dx=-20, dy=-35, fontSize=18, fontWeight="bold")
         .encode(
             x="active_grants:Q",
             y="total_funding_millions:Q",
             text="State:N",
-            color=alt.Color("political_alignment:N", scale=party_colors),
-            opacity=when_hover.then(alt.value(1)).otherwise(alt.value(0)),
+            color=alt.Color("political_alignment:N", scale=PARTY_SCALE),
         )
-        .transform_filter(alt.datum.year == selected_year)
+        .transform_filter(hover)
     )
 
     # Background year text
@@ -927,24 +1072,24 @@ def create_political_scatter(source_df, selected_year):
     return final_chart
 
 
-def final_vis(df, grants_by_state, lifecycle_df, directorate_data, termination_impact_df, political_source_df, selected_year):
+def final_vis(df, grants_by_year, lifecycle_df, directorate_data, termination_impact_df, political_source_df,
+              political_by_year, selected_year):
     """Create the complete NSF grants dashboard with all linked visualizations.
     
     Args:
         df: Raw NSF grants dataframe
-        grants_by_state: Grants data from prepare_grants_by_state_data()
+        grants_by_year: Dict mapping year to its slice of prepare_grants_by_state_data()
         lifecycle_df: Lifecycle data from prepare_lifecycle_data_with_statecode()
         directorate_data: Directorate data from prepare_directorate_data()
         termination_impact_df: Termination impact data from prepare_termination_impact_data()
         political_source_df: Political data from prepare_political_data()
+        political_by_year: Dict mapping year to its slice of political_source_df
         selected_year: Year to display on the choropleth (from sidebar)
     """
-    alt.data_transformers.enable('vegafusion')
-
     # Filter data for selected year
-    year_data = grants_by_state[grants_by_state['year'] == selected_year].copy()
-    min_grants = grants_by_state['num_grants'].min()
-    max_grants = grants_by_state['num_grants'].max()
+    year_data = grants_by_year[selected_year]
+    min_grants = min(year_df['num_grants'].min() for year_df in grants_by_year.values())
+    max_grants = max(year_df['num_grants'].max() for year_df in grants_by_year.values())
 
     # CREATE SHARED STATE SELECTION - use state to match lifecycle data
     state_selection = alt.selection_point(
@@ -969,7 +1114,7 @@ def final_vis(df, grants_by_state, lifecycle_df, directorate_data, termination_i
     lifecycle_line = create_lifecycle_line_chart(lifecycle_df, state_selection)
 
     # 5. TERMINATED GRANTS BAR CHART (Left of map, linked to selection)
-    terminated_data = grants_by_state[grants_by_state['year'] == 2025].copy()
+    terminated_data = grants_by_year[2025]
     terminated_data = terminated_data[terminated_data['terminated_grants'] > 0]
     
     # Add All States total
@@ -986,15 +1131,17 @@ def final_vis(df, grants_by_state, lifecycle_df, directorate_data, termination_i
     terminated_bar = create_terminated_bar_chart(terminated_data, state_selection)
 
     # 6. Political Alignment Scatter Plot
-    political_scatter = create_political_scatter(political_source_df, selected_year)
-
-    # Build columns using & (vertical) and | (horizontal) concatenation
-    column_1 = lifecycle_line & terminated_bar
-    column_2 = map_chart & political_scatter
-    column_3 = directorate_line & termination_impact_chart
+    political_scatter = create_political_scatter(
+        political_source_df, selected_year, political_by_year[selected_year]
+    )
 
-    # Combine columns horizontally
-    dashboard = (column_1 | column_2 | column_3).properties(
+    # Build the three columns and combine them horizontally in one constructor
+    # call: every chained &, |, properties, configure_* and resolve_* copies the
+    # whole chart tree again
+    dashboard = alt.hconcat(
+        alt.vconcat(lifecycle_line, terminated_bar),
+        alt.vconcat(map_chart, political_scatter),
+        alt.vconcat(directorate_line, termination_impact_chart),
         title=alt.TitleParams(
             text=f'NSF Grants Dashboard',
             subtitle="Explore NSF grant data and termination patterns",
@@ -1002,15 +1149,15 @@ def final_vis(df, grants_by_state, lifecycle_df, directorate_data, termination_i
             anchor='middle',
             offset=20
         ),
-        padding={'left': 40, 'right': 40, 'top': 10, 'bottom': 20}
-    ).configure_view(
-        strokeWidth=0
-    ).configure_concat(
-        spacing=40
-    ).resolve_scale(
-        color='independent'
-    ).resolve_legend(
-        color='independent'
+        padding={'left': 40, 'right': 40, 'top': 10, 'bottom': 20},
+        resolve=alt.Resolve(
+            scale=alt.ScaleResolveMap(color='independent'),
+            legend=alt.LegendResolveMap(color='independent')
+        ),
+        config=alt.Config(
+            view=alt.ViewConfig(strokeWidth=0),
+            concat=alt.CompositionConfig(spacing=40)
+        )
     )
     
     return dashboard
@@ -5,31 +5,24 @@ Description: Analyzes NSF active grants from 2020-2025 including terminated gran
 """
 
 import streamlit as st
-import altair as alt
+import os
+import re
 import json
+import hashlib
+import tempfile
+from pathlib import Path
 import streamlit.components.v1 as components
 
-# Import analysis functions
-from analysis_functions import (
-    load_data,
-    load_political_data,
-    prepare_grants_by_state_data,
-    prepare_directorate_data,
-    prepare_termination_impact_data,
-    prepare_lifecycle_data_with_statecode,
-    prepare_political_data,
-    final_vis
-)
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
-# Page configuration
-st.set_page_config(
-    page_title="NSF Grants Explorer",
-    layout="wide",
-    initial_sidebar_state="expanded"
-)
+# analysis_functions (pandas, altair, vega_datasets) is imported inside the
+# cached functions below, so reruns that hit the cache never touch it
 
 # Hide default padding for compact view and set white background
-st.markdown("""
+STYLE_HTML = """
 <style>
     .stApp {background-color: white !important; color: black !important;}
     .stAppHeader {background-color: transparent !important; display: none !important;}
@@ -47,7 +40,162 @@ st.markdown("""
     h3 {font-size: 1rem !important; margin-bottom: 0.2rem !important;}
     .stMetric {padding: 0.3rem !important;}
 </style>
-""", unsafe_allow_html=True)
+"""
+
+# Specs are written here and served by Streamlit under /app/static/
+# (requires server.enableStaticServing, see .streamlit/config.toml)
+STATIC_DIR = Path(__file__).parent / 'static'
+
+
+def static_url(name):
+    """URL at which Streamlit serves STATIC_DIR/name, honouring server.baseUrlPath."""
+    base_path = st.get_option('server.baseUrlPath').strip('/')
+    prefix = f"/{base_path}" if base_path else ""
+    return f"{prefix}/app/static/{name}"
+
+
+def write_static_file(name, data):
+    """Write bytes to STATIC_DIR/name unless the file already exists.
+
+    The bytes go to a temporary file that is then renamed into place, so two
+    sessions writing the same file cannot interleave and the browser never
+    fetches a partly written one.
+    """
+    path = STATIC_DIR / name
+    if path.exists():
+        return
+    STATIC_DIR.mkdir(exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=STATIC_DIR, prefix=f"{name}.", suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as tmp_file:
+            tmp_file.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+# Dashboard page rendered inside the components iframe; __SPEC_URL__ is replaced
+# with the URL of the serialized Vega-Lite spec. Library versions are pinned
+# (vega-lite matches the schema Altair 5 writes) so the browser can reuse its
+# cached copies across reruns
+VEGA_HTML_TEMPLATE = """
+<!DOCTYPE html>
+<html>
+<head>
+  <meta charset="utf-8">
+  <link rel="preload" href="https://cdn.jsdelivr.net/npm/vega@5.25.0" as="script" crossorigin>
+  <link rel="preload" href="https://cdn.jsdelivr.net/npm/vega-lite@5.20.1" as="script" crossorigin>
+  <link rel="preload" href="https://cdn.jsdelivr.net/npm/vega-embed@6.24.0" as="script" crossorigin>
+  <script src="https://cdn.jsdelivr.net/npm/vega@5.25.0" crossorigin></script>
+  <script src="https://cdn.jsdelivr.net/npm/vega-lite@5.20.1" crossorigin></script>
+  <script src="https://cdn.jsdelivr.net/npm/vega-embed@6.24.0" crossorigin></script>
+  <style>
+    html, body { margin: 0; padding: 0; background-color: white; }
+    #vis { width: 100%; display: flex; justify-content: center; align-items: flex-start; }
+  </style>
+</head>
+<body>
+  <div id="vis"></div>
+  <script type="text/javascript">
+    var spec = "__SPEC_URL__";
+    vegaEmbed('#vis', spec, {
+      "actions": false,
+      "renderer": "canvas"
+    });
+  </script>
+</body>
+</html>
+"""
+
+
+def prune_static_files(year, spec_name):
+    """Delete the year's superseded specs and any dataset CSV no spec links to.
+
+    Spec and dataset file names carry a content hash, so every data or chart
+    change writes new files; pruning on each rebuild keeps static/ from
+    growing for the life of the deployment. A page that loses a file this way
+    is rebuilt by the existence check in render_dashboard().
+    """
+    for path in STATIC_DIR.glob(f"spec_{year}_*.json"):
+        if path.name != spec_name:
+            path.unlink(missing_ok=True)
+
+    linked = set()
+    for path in STATIC_DIR.glob("spec_*.json"):
+        try:
+            linked.update(re.findall(r'data-[0-9a-f]+\.csv', path.read_text(encoding='utf-8')))
+        except FileNotFoundError:
+            continue
+    for path in STATIC_DIR.glob("data-*.csv"):
+        if path.name not in linked:
+            path.unlink(missing_ok=True)
+
+
+def externalize_csv_datasets(chart_spec):
+    """Move inline CSV datasets out of the spec into static files.
+
+    Altair names datasets after a hash of their contents, so each file is
+    written once and every year's spec links to the same URL, which the
+    browser caches instead of downloading the data again inside each spec.
+
+    Returns:
+        Names of the files written to STATIC_DIR
+    """
+    datasets = chart_spec.get('datasets', {})
+    urls = {}
+    file_names = []
+    for name, values in list(datasets.items()):
+        if isinstance(values, str):
+            file_name = f"{name}.csv"
+            write_static_file(file_name, values.encode('utf-8'))
+            file_names.append(file_name)
+            urls[name] = static_url(file_name)
+            del datasets[name]
+
+    def relink(node):
+        if isinstance(node, dict):
+            data = node.get('data')
+            if isinstance(data, dict) and data.get('name') in urls:
+                node['data'] = {key: value for key, value in data.items() if key != 'name'}
+                node['data']['url'] = urls[data['name']]
+            for value in node.values():
+                relink(value)
+        elif isinstance(node, list):
+            for item in node:
+                relink(item)
+
+    relink(chart_spec)
+    return file_names
+
+
+# Vertical space Vega adds around each view (title, subtitle, rotated axis
+# labels, bottom legend) and around the whole dashboard (title and padding).
+# These are generous estimates, not measurements: the iframe keeps scrolling
+# enabled so an underestimate scrolls instead of cutting off the bottom row
+VIEW_CHROME_HEIGHT = 150
+DASHBOARD_CHROME_HEIGHT = 120
+
+
+def spec_height(spec, spacing):
+    """Estimate the rendered height in pixels of a concatenated Vega-Lite spec."""
+    if 'vconcat' in spec:
+        children = spec['vconcat']
+        return sum(spec_height(child, spacing) for child in children) + spacing * (len(children) - 1)
+    if 'hconcat' in spec:
+        return max(spec_height(child, spacing) for child in spec['hconcat'])
+    return spec.get('height', 300) + VIEW_CHROME_HEIGHT
+
+
+# Page configuration
+st.set_page_config(
+    page_title="NSF Grants Explorer",
+    layout="wide",
+    initial_sidebar_state="expanded"
+)
+
+# Page styling has to be emitted on every full run: Streamlit removes any
+# element that a run does not draw again
+st.markdown(STYLE_HTML, unsafe_allow_html=True)
 
 # ============================================================================
 # SIDEBAR CONTROLS
@@ -55,43 +203,27 @@ st.markdown("""
 
 st.sidebar.title("NSF Grants Explorer")
 
-# Year Selection with 2x3 button grid
+# Year Selection
 st.sidebar.markdown("### Select Year")
 
+YEARS = [2020, 2021, 2022, 2023, 2024, 2025]
+
 # Initialize selected year in session state
 if 'selected_year' not in st.session_state:
     st.session_state.selected_year = 2025
+    st.session_state.year_control = 2025
 
-# Create 2x3 grid of year buttons in sidebar
-with st.sidebar:
-    year_row1 = st.columns(3)
-    year_row2 = st.columns(3)
-    
-    years = [2020, 2021, 2022, 2023, 2024, 2025]
-    
-    for i, year in enumerate(years[:3]):
-        with year_row1[i]:
-            if st.button(
-                str(year), 
-                key=f"year_{year}",
-                use_container_width=True,
-                type="primary" if st.session_state.selected_year == year else "secondary"
-            ):
-                st.session_state.selected_year = year
-                st.rerun()
-    
-    for i, year in enumerate(years[3:]):
-        with year_row2[i]:
-            if st.button(
-                str(year), 
-                key=f"year_{year}",
-                use_container_width=True,
-                type="primary" if st.session_state.selected_year == year else "secondary"
-            ):
-                st.session_state.selected_year = year
-                st.rerun()
-
-selected_year = st.session_state.selected_year
+
+def select_year():
+    """Store the chosen year, re-selecting the current one if it was clicked again."""
+    if st.session_state.year_control is None:
+        st.session_state.year_control = st.session_state.selected_year
+    else:
+        st.session_state.selected_year = st.session_state.year_control
+
+
+# Year selector is drawn by the dashboard fragment below
+year_panel = st.sidebar.container()
 
 st.sidebar.markdown("---")
 st.sidebar.caption("NSF grants 2020-2025 | By Nicolás Villoria & Oriol Fontanals")
@@ -100,24 +232,43 @@ st.sidebar.caption("NSF grants 2020-2025 | By Nicolás Villoria & Oriol Fontanal
 # DATA LOADING 
 # ============================================================================
 
-@st.cache_data
+@st.cache_resource
 def get_data():
-    """Load and cache all data."""
+    """Load and cache all data.
+
+    Cached as a resource so reruns share the DataFrames by reference instead of
+    unpickling a copy; they are treated as read-only downstream.
+    """
+    from analysis_functions import (
+        load_data,
+        load_political_data,
+        count_terminated,
+        prepare_grants_by_state_data,
+        prepare_directorate_data,
+        prepare_termination_impact_data,
+        prepare_lifecycle_data_with_statecode,
+        prepare_political_data
+    )
+
     df = load_data()
     political_df = load_political_data()
-    grants_by_state = prepare_grants_by_state_data(df)
-    directorate_data = prepare_directorate_data(df)
-    termination_impact_df = prepare_termination_impact_data(df)
+    terminated_counts = count_terminated(df)
+    grants_by_state = prepare_grants_by_state_data(df, terminated_counts)
+    grants_by_year = {year: year_df for year, year_df in grants_by_state.groupby('year')}
+    directorate_data = prepare_directorate_data(df, terminated_counts)
+    termination_impact_df = prepare_termination_impact_data(df, terminated_counts)
     lifecycle_df = prepare_lifecycle_data_with_statecode(df)
-    political_source_df = prepare_political_data(df, political_df)
+    political_source_df = prepare_political_data(df, political_df, terminated_counts)
+    political_by_year = {year: year_df for year, year_df in political_source_df.groupby('year')}
     
     return {
         'df': df,
-        'grants_by_state': grants_by_state,
+        'grants_by_year': grants_by_year,
         'directorate_data': directorate_data,
         'termination_impact_df': termination_impact_df,
         'lifecycle_df': lifecycle_df,
-        'political_source_df': political_source_df
+        'political_source_df': political_source_df,
+        'political_by_year': political_by_year
     }
 
 # Load data
@@ -127,46 +278,83 @@ data = get_data()
 # MAIN CONTENT - COMPACT GRID LAYOUT
 # ============================================================================
 
-# Generate final visualization based on selected year
-final_chart = final_vis(
-    data['df'],
-    data['grants_by_state'],
-    data['lifecycle_df'],
-    data['directorate_data'],
-    data['termination_impact_df'],
-    data['political_source_df'],
-    selected_year
-)
+@st.cache_data
+def build_vega_html(year):
+    """Build and cache the dashboard HTML and its iframe height for a given year.
 
-# Render as HTML to prevent blinking on Linux
-# Disable vegafusion and max rows limit to avoid dependencies
-alt.data_transformers.enable('default', max_rows=None)
-chart_spec = final_chart.to_dict()
-vega_html = f"""
-<!DOCTYPE html>
-<html>
-<head>
-  <meta charset="utf-8">
-  <script src="https://cdn.jsdelivr.net/npm/vega@5"></script>
-  <script src="https://cdn.jsdelivr.net/npm/vega-lite@5"></script>
-  <script src="https://cdn.jsdelivr.net/npm/vega-embed@6"></script>
-  <style>
-    html, body {{ margin: 0; padding: 0; background-color: white; }}
-    #vis {{ width: 100%; display: flex; justify-content: center; align-items: flex-start; }}
-  </style>
-</head>
-<body>
-  <div id="vis"></div>
-  <script type="text/javascript">
-    var spec = {json.dumps(chart_spec)};
-    vegaEmbed('#vis', spec, {{
-      "actions": false,
-      "renderer": "svg"
-    }});
-  </script>
-</body>
-</html>
-"""
-components.html(vega_html, height=1100, scrolling=True)
+    Also returns the names of the files in STATIC_DIR that the HTML links to.
+    """
+    import altair as alt
+    from analysis_functions import final_vis
 
-# ============================================================================
+    # Serialize data inline with the default transformer, without its max_rows cap
+    alt.data_transformers.enable('default', max_rows=None)
+
+    # Generate final visualization based on selected year. The chart is built
+    # by our own factories, so skip the jsonschema validation Altair otherwise
+    # runs on every object it constructs and again on serialization
+    with alt.utils.schemapi.debug_mode(False):
+        final_chart = final_vis(
+            data['df'],
+            data['grants_by_year'],
+            data['lifecycle_df'],
+            data['directorate_data'],
+            data['termination_impact_df'],
+            data['political_source_df'],
+            data['political_by_year'],
+            year
+        )
+        chart_spec = final_chart.to_dict(validate=False)
+    data_files = externalize_csv_datasets(chart_spec)
+    if orjson is not None:
+        spec_bytes = orjson.dumps(chart_spec, option=orjson.OPT_SERIALIZE_NUMPY)
+    else:
+        spec_bytes = json.dumps(
+            chart_spec, separators=(',', ':'), ensure_ascii=False, check_circular=False
+        ).encode()
+
+    # Serve the spec as a static file so the browser can cache it and reruns
+    # only send the small HTML page over the websocket
+    spec_name = f"spec_{year}_{hashlib.sha256(spec_bytes).hexdigest()[:16]}.json"
+    write_static_file(spec_name, spec_bytes)
+    prune_static_files(year, spec_name)
+
+    # Size the iframe to the estimated dashboard height instead of a fixed 1100px
+    spacing = chart_spec.get('config', {}).get('concat', {}).get('spacing', 20)
+    height = spec_height(chart_spec, spacing) + DASHBOARD_CHROME_HEIGHT
+    vega_html = VEGA_HTML_TEMPLATE.replace("__SPEC_URL__", static_url(spec_name))
+    return vega_html, height, (spec_name, *data_files)
+
+
+# Single-element slot for the dashboard iframe: each rerun replaces its
+# contents in place rather than appending a new element
+chart_slot = st.empty()
+
+
+@st.fragment
+def render_dashboard():
+    """Draw the year selector and the dashboard for the selected year.
+
+    Runs as a fragment so a year click only reruns this function instead of
+    the whole script (page styling, sidebar layout, data lookup).
+    """
+    st.segmented_control(
+        "Select Year",
+        options=YEARS,
+        key="year_control",
+        on_change=select_year,
+        label_visibility="collapsed"
+    )
+
+    with chart_slot:
+        vega_html, height, static_files = build_vega_html(st.session_state.selected_year)
+        # The cached HTML links to files in static/; rebuild if any was removed
+        if not all((STATIC_DIR / name).exists() for name in static_files):
+            build_vega_html.clear()
+            vega_html, height, static_files = build_vega_html(st.session_state.selected_year)
+        # Render as HTML to prevent blinking on Linux
+        components.html(vega_html, height=height, scrolling=True)
+
+
+with year_panel:
+    render_dashboard()
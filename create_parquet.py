@@ -0,0 +1,39 @@
+"""
+Script to convert nsf_data_clean.csv into a Parquet snapshot.
+The snapshot keeps the columns the dashboard uses, with dates already
+parsed, so the app can load it directly instead of parsing the CSV on startup.
+"""
+
+from pathlib import Path
+import os
+
+from analysis_functions import DATA_CSV, DATA_PARQUET, read_grants_csv
+
+
+def create_parquet(base_dir: str):
+    """
+    Write the Parquet snapshot of the cleaned grants data.
+
+    Args:
+        base_dir: Directory containing nsf_data_clean.csv
+    """
+    os.chdir(base_dir)
+
+    print(f"Reading {DATA_CSV}...")
+    df = read_grants_csv()
+    print(f"  - Loaded {len(df):,} grants")
+
+    print(f"Saving snapshot to {DATA_PARQUET}...")
+    df.to_parquet(DATA_PARQUET, index=False)
+    print(f"  - {Path(DATA_CSV).stat().st_size / 1e6:.1f} MB CSV -> "
+          f"{Path(DATA_PARQUET).stat().st_size / 1e6:.1f} MB Parquet")
+
+
+def main():
+    """Main function."""
+    base_dir = Path(__file__).parent
+    create_parquet(str(base_dir))
+
+
+if __name__ == "__main__":
+    main()